@@ -26,71 +26,141 @@ with st.sidebar:
 
 uploaded = st.file_uploader("Carica il CSV (docenti × classi)", type=["csv"])
 
+@st.cache_data(show_spinner="Elaborazione CSV…")
+def run_pipeline(file_bytes: bytes, sep: str):
+    """Parse + raggruppamento + validazione, memoizzati sui byte del file.
+
+    Ai rerun di Streamlit (toggle, widget) il risultato arriva dalla cache
+    senza rifare parse del CSV e costruzione del grafo.
+    """
+    df = load_df(io.BytesIO(file_bytes), sep=sep)
+    valid_cols, class_to_teachers, year_letter_to_class, complete_letters = build_class_teacher_map(df)
+    tables, validation_df = [], None
+    if complete_letters:
+        conflicts = letters_conflict_graph(complete_letters, class_to_teachers, year_letter_to_class)
+        groups = greedy_group_letters(complete_letters, conflicts, max_group_size=4)
+        tables = build_tables(groups, year_letter_to_class)
+        validation_df = validate_rows(tables, class_to_teachers)
+    return df, tables, validation_df
+
+def _tables_sig(tables: List[Tuple[int, list, pd.DataFrame]]) -> tuple:
+    """Firma stabile e hashabile delle tabelle, usata come chiave di cache."""
+    return tuple((gi, tuple(g), tab.to_csv()) for gi, g, tab in tables)
+
+@st.fragment
+def _render_table_tab(g: list, tab: pd.DataFrame):
+    # fragment per tab: la serializzazione Arrow della tabella non blocca
+    # il render delle altre e i rerun del tab restano locali
+    st.markdown(f"**Colonne:** {', '.join(g)}")
+    st.dataframe(tab, use_container_width=True)
+
+@st.fragment
+def _render_preview(df: pd.DataFrame):
+    # slice stretta (20 righe, max 30 colonne): la serializzazione Arrow
+    # verso il client non paga l'intero DataFrame
+    st.dataframe(df.iloc[:20, :min(30, df.shape[1])], use_container_width=True, hide_index=True)
+
 def make_zip_of_tables(tables: List[Tuple[int, list, pd.DataFrame]], validation_df: pd.DataFrame) -> bytes:
     """Crea uno ZIP in memoria con tutte le tabelle CSV + riepilogo + verifica."""
     mem = io.BytesIO()
-    with zipfile.ZipFile(mem, mode="w", compression=zipfile.ZIP_DEFLATED) as z:
+    # CSV di pochi KB: STORED evita il costo di zlib senza perdita apprezzabile
+    with zipfile.ZipFile(mem, mode="w", compression=zipfile.ZIP_STORED) as z:
+        def write_csv(name: str, frame: pd.DataFrame, **to_csv_kwargs):
+            # stream diretto nell'archivio: to_csv encoda una volta sola in
+            # utf-8, senza str intermedia né buffer BytesIO per tabella
+            with z.open(zipfile.ZipInfo(name), "w") as fh:
+                with io.TextIOWrapper(fh, encoding="utf-8", newline="") as txt:
+                    frame.to_csv(txt, **to_csv_kwargs)
         # tabelle
         for gi, g, tab in tables:
-            name = f"tabella_{gi}_{''.join(g)}.csv"
-            z.writestr(name, tab.to_csv())
+            write_csv(f"tabella_{gi}_{''.join(g)}.csv", tab)
         # riepilogo gruppi
         summary = pd.DataFrame([{"Tabella": gi, "Lettere (colonne)": " | ".join(g), "N. colonne": len(g)} for gi, g, _ in tables])
-        z.writestr("riepilogo_gruppi.csv", summary.to_csv(index=False))
+        write_csv("riepilogo_gruppi.csv", summary, index=False)
         # validazione
-        z.writestr("verifica_righe.csv", validation_df.to_csv(index=False))
+        write_csv("verifica_righe.csv", validation_df, index=False)
     return mem.getvalue()
 
-def build_pdf_bytes(tables: List[Tuple[int, list, pd.DataFrame]]) -> bytes:
-    """Genera un PDF in memoria con le tabelle (usa reportlab)."""
+@st.cache_data(show_spinner=False)
+def make_zip_cached(sig: tuple, _tables, _validation_df) -> bytes:
+    return make_zip_of_tables(_tables, _validation_df)
+
+@st.cache_resource
+def _reportlab():
+    """Importa reportlab una volta per sessione Streamlit e riusa i simboli."""
     from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
     from reportlab.lib import colors
     from reportlab.lib.pagesizes import A4
     from reportlab.lib.styles import getSampleStyleSheet
+    return SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, colors, A4, getSampleStyleSheet()
 
-    mem_pdf = io.BytesIO()
-    styles = getSampleStyleSheet()
-    doc = SimpleDocTemplate(mem_pdf, pagesize=A4)
-    elements = []
-    for gi, g, tab in tables:
-        elements.append(Paragraph(f"Tabella {gi} – Colonne: {', '.join(g)}", styles['Heading2']))
-        data = [["Anno"] + list(g)]
-        for y in tab.index:
-            row = [str(y)] + [tab.loc[y, L] if pd.notna(tab.loc[y, L]) else "" for L in g]
-            data.append(row)
-        t = Table(data, hAlign="LEFT")
-        t.setStyle(TableStyle([
+_TBL_STYLE = None
+
+def _tbl_style():
+    """Costruisce (una volta sola) lo stile condiviso da tutte le tabelle PDF."""
+    global _TBL_STYLE
+    if _TBL_STYLE is None:
+        _, _, TableStyle, _, _, colors, _, _ = _reportlab()
+        _TBL_STYLE = TableStyle([
             ('BACKGROUND',(0,0),(-1,0),colors.grey),
             ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),
             ('ALIGN',(0,0),(-1,-1),'CENTER'),
             ('GRID',(0,0),(-1,-1),0.5,colors.black),
             ('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'),
             ('BACKGROUND',(0,1),(-1,-1),colors.beige),
-        ]))
-        elements.append(t)
+        ])
+    return _TBL_STYLE
+
+def build_pdf_bytes(tables: List[Tuple[int, list, pd.DataFrame]]) -> bytes:
+    """Genera un PDF in memoria con le tabelle (usa reportlab)."""
+    SimpleDocTemplate, Table, _, Paragraph, Spacer, _, A4, styles = _reportlab()
+
+    mem_pdf = io.BytesIO()
+    doc = SimpleDocTemplate(mem_pdf, pagesize=A4)
+    elements = []
+    for gi, g, tab in tables:
+        elements.append(Paragraph(f"Tabella {gi} – Colonne: {', '.join(g)}", styles['Heading2']))
+        arr = tab.to_numpy(dtype=object, na_value="")
+        years = tab.index.to_numpy()
+        data = [["Anno", *g]] + [[str(years[i]), *arr[i].tolist()] for i in range(len(years))]
+        elements.append(Table(data, style=_tbl_style(), hAlign="LEFT"))
         elements.append(Spacer(1, 12))
     doc.build(elements)
     mem_pdf.seek(0)
     return mem_pdf.getvalue()
 
+@st.cache_data(show_spinner=False)
+def build_pdf_cached(sig: tuple, _tables) -> bytes:
+    return build_pdf_bytes(_tables)
+
+@st.fragment
+def _render_pdf_export(tables: List[Tuple[int, list, pd.DataFrame]]):
+    """Genera il PDF solo su richiesta esplicita, fuori dal rerun principale."""
+    with st.expander("Esporta PDF"):
+        if st.button("Prepara PDF"):
+            try:
+                pdf_bytes = build_pdf_cached(_tables_sig(tables), tables)
+                st.download_button(
+                    "⬇️ Scarica PDF con tutte le tabelle",
+                    data=pdf_bytes,
+                    file_name="tabelle_consigli.pdf",
+                    mime="application/pdf"
+                )
+            except Exception as e:
+                st.warning(f"PDF non generato (ReportLab non disponibile?): {e}")
+
 if uploaded:
     try:
         sep_map = {";": ";", ",": ",", "\\t": "\t"}
-        df = load_df(uploaded, sep=sep_map[sep])
+        df, tables, validation_df = run_pipeline(uploaded.getvalue(), sep_map[sep])
         st.success("CSV caricato correttamente.")
         with st.expander("Anteprima dati", expanded=False):
-            st.dataframe(df.head(20), use_container_width=True)
+            _render_preview(df)
 
-        valid_cols, class_to_teachers, year_letter_to_class, complete_letters = build_class_teacher_map(df)
-        if not complete_letters:
+        if not tables:
             st.error("Nessuna lettera presente per tutti i 5 anni. Non posso costruire colonne coerenti 1..5.")
             st.stop()
 
-        conflicts = letters_conflict_graph(complete_letters, class_to_teachers, year_letter_to_class)
-        groups = greedy_group_letters(complete_letters, conflicts, max_group_size=4)
-        tables = build_tables(groups, year_letter_to_class)
-        validation_df = validate_rows(tables, class_to_teachers)
-
         # RIEPILOGO
         st.subheader("📋 Riepilogo gruppi (tabelle 5×4)")
         summary = pd.DataFrame([
@@ -104,15 +174,14 @@ if uploaded:
         tabs = st.tabs([f"Tabella {gi} ({' '.join(g)})" for gi, g, _ in tables])
         for tab_obj, (gi, g, tab) in zip(tabs, tables):
             with tab_obj:
-                st.markdown(f"**Colonne:** {', '.join(g)}")
-                st.dataframe(tab, use_container_width=True)
+                _render_table_tab(g, tab)
 
         # VALIDAZIONE
         st.subheader("✅ Verifica per riga (nessun docente in comune)")
         st.dataframe(validation_df, use_container_width=True)
 
         # Download ZIP
-        zip_bytes = make_zip_of_tables(tables, validation_df)
+        zip_bytes = make_zip_cached(_tables_sig(tables), tables, validation_df)
         st.download_button(
             "⬇️ Scarica ZIP (tabelle + riepilogo + verifica)",
             data=zip_bytes,
@@ -122,16 +191,7 @@ if uploaded:
 
         # PDF opzionale
         if generate_pdf:
-            try:
-                pdf_bytes = build_pdf_bytes(tables)
-                st.download_button(
-                    "⬇️ Scarica PDF con tutte le tabelle",
-                    data=pdf_bytes,
-                    file_name="tabelle_consigli.pdf",
-                    mime="application/pdf"
-                )
-            except Exception as e:
-                st.warning(f"PDF non generato (ReportLab non disponibile?): {e}")
+            _render_pdf_export(tables)
 
     except Exception as e:
         st.error(f"Errore: {e}")
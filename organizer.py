@@ -1,19 +1,43 @@
 # organizer.py
 import re
+from collections import defaultdict
 from itertools import combinations
-from typing import Dict, List, Set, Tuple
+from typing import Dict, FrozenSet, List, Tuple
 
+import numpy as np
 import pandas as pd
 
+try:
+    from organizer_numba import greedy_color as _greedy_color_jit
+except ImportError:  # numba non installato: si usa il fallback Python
+    _greedy_color_jit = None
+
+_CLASS_RE = re.compile(r"([1-5])([A-Z])")
+
 def parse_class(col: str):
     """Ritorna (anno:int, lettera:str) se col è del tipo '1A'..'5Z', altrimenti None."""
-    m = re.fullmatch(r"([1-5])([A-Z])", str(col).strip())
+    m = _CLASS_RE.fullmatch(col.strip() if isinstance(col, str) else str(col).strip())
     if m:
         return int(m.group(1)), m.group(2)
     return None
 
 def load_df(file, sep=";") -> pd.DataFrame:
-    df = pd.read_csv(file, sep=sep)
+    # scan economico del solo header: si rileggono poi solo le colonne utili
+    # (Docente + classi 1A..5Z), già con il dtype giusto
+    header = pd.read_csv(file, sep=sep, nrows=0).columns
+    if hasattr(file, "seek"):
+        file.seek(0)
+    keep = [c for c in header
+            if str(c).strip().lower() == "docente" or _CLASS_RE.fullmatch(str(c).strip())]
+    usecols = keep if keep else None
+    try:
+        # parser Arrow: molto più veloce del C engine su CSV larghi di stringhe corte
+        df = pd.read_csv(file, sep=sep, usecols=usecols, dtype="string", engine="pyarrow")
+    except (ImportError, ValueError):
+        # pyarrow assente o opzione non supportata: engine di default
+        if hasattr(file, "seek"):
+            file.seek(0)
+        df = pd.read_csv(file, sep=sep, usecols=usecols, dtype="string")
     # normalizza colonna Docente
     if "Docente" not in df.columns:
         for c in df.columns:
@@ -22,81 +46,139 @@ def load_df(file, sep=";") -> pd.DataFrame:
                 break
     if "Docente" not in df.columns:
         raise ValueError("Colonna 'Docente' non trovata nel CSV.")
-    df["Docente"] = df["Docente"].astype(str).str.strip()
+    # una sola passata di normalizzazione: a valle nessuno deve più strippare
+    df["Docente"] = df["Docente"].astype("string").str.strip()
+    class_cols = [c for c in df.columns if c != "Docente"]
+    if class_cols:
+        df[class_cols] = df[class_cols].astype("string").apply(lambda s: s.str.strip())
     return df
 
 def build_class_teacher_map(df: pd.DataFrame):
     """Ritorna (valid_cols, class_to_teachers, year_letter_to_class, complete_letters)."""
     class_cols = [c for c in df.columns if c != "Docente"]
-    valid_cols = [c for c in class_cols if parse_class(c) is not None]
+    # un solo parse per colonna: valid_cols e la mappa (anno, lettera)
+    # derivano entrambi dallo stesso dict
+    parsed_all = {c: parse_class(c) for c in class_cols}
+    valid_cols = [c for c, p in parsed_all.items() if p is not None]
 
-    class_to_teachers: Dict[str, Set[str]] = {}
-    for c in valid_cols:
-        mask = df[c].astype(str).str.strip().ne("") & df[c].notna()
-        teachers = set(df.loc[mask, "Docente"].astype(str).str.strip())
-        class_to_teachers[c] = teachers
+    # melt una volta sola: filtro e aggregazione girano in C invece che
+    # in un loop Python per colonna (le celle sono già strippate da load_df)
+    long = df[["Docente"] + valid_cols].melt(id_vars="Docente", var_name="Classe", value_name="val")
+    long = long[long["val"].notna() & long["val"].ne("")]
+    # set(...) esplicito: con dtype Arrow l'agg(set) viene ri-coercito a list
+    grouped = long.groupby("Classe", sort=False)["Docente"].agg(set).to_dict()
+    # frozenset: i set dei docenti sono di sola lettura dopo la costruzione
+    class_to_teachers: Dict[str, FrozenSet[str]] = {c: frozenset(grouped.get(c, ())) for c in valid_cols}
 
-    parsed = {c: parse_class(c) for c in valid_cols}
-    year_letter_to_class = {parsed[c]: c for c in valid_cols}
+    year_letter_to_class = {parsed_all[c]: c for c in valid_cols}
     letters = sorted({ltr for (_, ltr) in year_letter_to_class.keys()})
     complete_letters = [ltr for ltr in letters if all((y, ltr) in year_letter_to_class for y in range(1, 6))]
     return valid_cols, class_to_teachers, year_letter_to_class, complete_letters
 
+def _teacher_bitmasks(class_to_teachers: Dict[str, FrozenSet[str]]) -> Tuple[Dict[str, np.ndarray], int]:
+    """Codifica i docenti di ogni classe come bitmask uint64 (un bit per docente).
+
+    Ritorna (classe -> array uint64 di `words` parole, words).
+    """
+    all_teachers = sorted({t for ts in class_to_teachers.values() for t in ts})
+    teacher_index = {t: i for i, t in enumerate(all_teachers)}
+    words = max((len(all_teachers) + 63) // 64, 1)
+    masks: Dict[str, np.ndarray] = {}
+    for c, ts in class_to_teachers.items():
+        m = np.zeros(words, dtype=np.uint64)
+        for t in ts:
+            ti = teacher_index[t]
+            m[ti >> 6] |= np.uint64(1) << np.uint64(ti & 63)
+        masks[c] = m
+    return masks, words
+
 def letters_conflict_graph(letters: List[str],
-                           class_to_teachers: Dict[str, Set[str]],
-                           year_letter_to_class: Dict[Tuple[int, str], str]) -> Dict[str, Set[str]]:
-    """Conflitto tra due lettere se in almeno un anno condividono docenti."""
-    conflicts = {L: set() for L in letters}
-    for i, L1 in enumerate(letters):
-        for L2 in letters[i+1:]:
-            for y in range(1, 6):
-                c1 = year_letter_to_class[(y, L1)]
-                c2 = year_letter_to_class[(y, L2)]
-                if class_to_teachers[c1] & class_to_teachers[c2]:
-                    conflicts[L1].add(L2)
-                    conflicts[L2].add(L1)
-                    break
+                           class_to_teachers: Dict[str, FrozenSet[str]],
+                           year_letter_to_class: Dict[Tuple[int, str], str]) -> np.ndarray:
+    """Conflitto tra due lettere se in almeno un anno condividono docenti.
+
+    Indice inverso docente -> lettere per anno: per roster sparsi (quasi
+    tutti i docenti in 1-3 classi) il lavoro è Σ C(k, 2) con k piccolo,
+    molto meno delle L² × 5 intersezioni tra tutte le coppie.
+    Ritorna una matrice booleana (L, L) simmetrica con diagonale False.
+    """
+    letter_idx = {ltr: i for i, ltr in enumerate(letters)}
+    n_letters = len(letters)
+    conflicts = np.zeros((n_letters, n_letters), dtype=bool)
+    teacher_to_yl: Dict[str, Dict[int, List[int]]] = defaultdict(lambda: defaultdict(list))
+    for (y, ltr), c in year_letter_to_class.items():
+        li = letter_idx.get(ltr)
+        if li is None:
+            continue
+        for t in class_to_teachers[c]:
+            teacher_to_yl[t][y].append(li)
+    for years in teacher_to_yl.values():
+        for letters_here in years.values():
+            for i1, i2 in combinations(letters_here, 2):
+                conflicts[i1, i2] = True
+                conflicts[i2, i1] = True
     return conflicts
 
-def greedy_group_letters(letters: List[str], conflicts: Dict[str, Set[str]], max_group_size: int = 4) -> List[List[str]]:
+def greedy_group_letters(letters: List[str], conflicts: np.ndarray, max_group_size: int = 4) -> List[List[str]]:
     """Euristica greedy: lettere più “difficili” prima, poi nel primo gruppo compatibile."""
-    letters_sorted = sorted(letters, key=lambda L: len(conflicts[L]), reverse=True)
-    groups: List[List[str]] = []
-    for L in letters_sorted:
-        placed = False
-        for g in groups:
-            if len(g) < max_group_size and all(L not in conflicts[other] for other in g):
-                g.append(L)
-                placed = True
-                break
-        if not placed:
-            groups.append([L])
-    return groups
+    degree = conflicts.sum(axis=1)
+    order = np.argsort(-degree, kind="stable")
+    if _greedy_color_jit is not None:
+        adj = np.ascontiguousarray(conflicts, dtype=np.bool_)
+        group_of = _greedy_color_jit(adj, order.astype(np.int64), max_group_size)
+        groups_idx: List[List[int]] = [[] for _ in range(int(group_of.max()) + 1 if len(group_of) else 0)]
+        for li in order:
+            groups_idx[group_of[li]].append(int(li))
+    else:
+        # adiacenza impacchettata in int Python (un bit per lettera): il test
+        # "può entrare nel gruppo?" diventa un AND + confronto, zero lookup
+        adj_int = [int.from_bytes(np.packbits(conflicts[i], bitorder="little").tobytes(), "little")
+                   for i in range(len(letters))]
+        groups_idx = []
+        group_masks: List[int] = []
+        for li in order:
+            li = int(li)
+            placed = False
+            for gi, mask in enumerate(group_masks):
+                if mask.bit_count() < max_group_size and (adj_int[li] & mask) == 0:
+                    groups_idx[gi].append(li)
+                    group_masks[gi] = mask | (1 << li)
+                    placed = True
+                    break
+            if not placed:
+                groups_idx.append([li])
+                group_masks.append(1 << li)
+    return [[letters[i] for i in g] for g in groups_idx]
 
 def build_tables(groups: List[List[str]], year_letter_to_class: Dict[Tuple[int, str], str]):
     """Ritorna lista di tuple (gi, lettere_del_gruppo, tabella_df 5x|g|)."""
     tables = []
+    index = pd.RangeIndex(1, 6, name="Anno")
     for gi, g in enumerate(groups, start=1):
-        data = []
-        for y in range(1, 6):
-            row = {"Anno": y}
-            for L in g:
-                row[L] = year_letter_to_class.get((y, L), "")
-            data.append(row)
-        tab = pd.DataFrame(data).set_index("Anno")
+        # array object pre-dimensionato: niente dict intermedi né set_index
+        arr = np.empty((5, len(g)), dtype=object)
+        for j, L in enumerate(g):
+            for i, y in enumerate(range(1, 6)):
+                arr[i, j] = year_letter_to_class.get((y, L), "")
+        tab = pd.DataFrame(arr, index=index, columns=g)
         tables.append((gi, g, tab))
     return tables
 
-def validate_rows(tables, class_to_teachers: Dict[str, Set[str]]) -> pd.DataFrame:
-    def row_ok(class_names: List[str]) -> bool:
-        cl = [c for c in class_names if c]
-        for c1, c2 in combinations(cl, 2):
-            if class_to_teachers[c1] & class_to_teachers[c2]:
-                return False
-        return True
-    rows = []
+def validate_rows(tables, class_to_teachers: Dict[str, FrozenSet[str]]) -> pd.DataFrame:
+    """Verifica ogni riga (anno) ANDando le bitmask delle classi del gruppo."""
+    masks, words = _teacher_bitmasks(class_to_teachers)
+    empty = np.zeros(words, dtype=np.uint64)
+    col_tab, col_anno, col_ok = [], [], []
     for gi, g, tab in tables:
-        for y in tab.index:
-            ok = row_ok([tab.loc[y, L] for L in g])
-            rows.append({"Tabella": gi, "Anno": y, "Valida (nessun docente in comune)": "Sì" if ok else "No"})
-    return pd.DataFrame(rows)
+        arr = tab.to_numpy()
+        years = tab.index.to_numpy()
+        # (5, |g|, words): bitmask di ogni cella della tabella
+        sub = np.array([[masks.get(c, empty) for c in arr[i]] for i in range(len(years))])
+        pairwise = (sub[:, :, None, :] & sub[:, None, :, :]).any(axis=-1)
+        idx = np.arange(len(g))
+        pairwise[:, idx, idx] = False
+        ok_per_year = ~pairwise.any(axis=(1, 2))
+        col_tab.extend([gi] * len(years))
+        col_anno.extend(years.tolist())
+        col_ok.extend(np.where(ok_per_year, "Sì", "No").tolist())
+    return pd.DataFrame({"Tabella": col_tab, "Anno": col_anno, "Valida (nessun docente in comune)": col_ok})
@@ -0,0 +1,42 @@
+# organizer_numba.py
+"""Percorso opzionale compilato con Numba per il greedy coloring.
+
+Se numba non è installato l'import fallisce e organizer ripiega sulla
+versione pura Python di `greedy_group_letters`.
+"""
+import numpy as np
+from numba import njit
+
+@njit(cache=True)
+def greedy_color(adj: np.ndarray, order: np.ndarray, max_size: int) -> np.ndarray:
+    """Colora il grafo di adiacenza booleano (L, L) in gruppi di al più max_size.
+
+    Visita le lettere nell'ordine dato e assegna ciascuna al primo gruppo
+    compatibile (nessun arco verso i membri già presenti). Ritorna un
+    array (L,) int32 con l'id del gruppo di ogni lettera.
+    """
+    n = adj.shape[0]
+    group_of = np.full(n, -1, dtype=np.int32)
+    group_sizes = np.zeros(n, dtype=np.int32)
+    n_groups = 0
+    for k in range(order.shape[0]):
+        li = order[k]
+        placed = False
+        for gi in range(n_groups):
+            if group_sizes[gi] >= max_size:
+                continue
+            ok = True
+            for j in range(n):
+                if group_of[j] == gi and adj[li, j]:
+                    ok = False
+                    break
+            if ok:
+                group_of[li] = gi
+                group_sizes[gi] += 1
+                placed = True
+                break
+        if not placed:
+            group_of[li] = n_groups
+            group_sizes[n_groups] = 1
+            n_groups += 1
+    return group_of